@@ -1,10 +1,9 @@
 import asyncio
-import json
 import logging
 from contextvars import ContextVar
 from pathlib import Path
 
-from fastapi import APIRouter, FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from fastapi.websockets import WebSocketState
 from prometheus_client import Gauge
@@ -15,14 +14,21 @@ from starlette_exporter import handle_metrics, PrometheusMiddleware
 from .config import Config
 from .context_vars import CONTROLLER, KUBE_CONTROLLER1, KUBE_CONTROLLER2
 from .controller import AWSController
-from .models import SnaphotsEvent, VolumesEvent
+from .dispatcher import CommandDispatcher
+from .models import PVDetails, PVsEvent, Snapshot
+from .tracing import configure as configure_tracing, shutdown as shutdown_tracing
 
 
 config = Config()
+configure_tracing(
+    slow_threshold=config.TRACE_SLOW_THRESHOLD,
+    export_file=config.TRACE_EXPORT_FILE,
+    otlp_endpoint=config.TRACE_OTLP_ENDPOINT,
+)
 UP = Gauge('up', 'Snapshot Manager is up', ['app'])
 UP.labels(app='snapshot_manager').set(1)
 
-CONTROLLER.set(AWSController())
+CONTROLLER.set(AWSController(max_staleness=config.INVENTORY_MAX_STALENESS))
 KUBE_CONTROLLER1.set(KubeController(config.KUBECONFIG1, 'kube1'))
 KUBE_CONTROLLER2.set(KubeController(config.KUBECONFIG2, 'kube2'))
 
@@ -67,76 +73,139 @@ def get_kube_controller(event, default_cluster=None) -> KubeController:
         raise ValueError(f'Unknown cluster {event=}')
 
 
+@root.get('/api/snapshots/{snap_id}', response_model=Snapshot)
+async def get_snapshot(snap_id: str):
+    snapshot = await CONTROLLER.get().get_snapshot(snap_id)
+    if not snapshot:
+        raise HTTPException(status_code=404, detail=f'Snapshot {snap_id} not found')
+    return snapshot
+
+
+@root.get('/api/kube/{cluster}/pvs/{name}', response_model=PVDetails)
+async def get_pv(cluster: str, name: str):
+    try:
+        kc = get_kube_controller({'cluster': cluster})
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f'Unknown cluster {cluster}')
+    pv = await kc.get_pv(name)
+    if not pv:
+        raise HTTPException(status_code=404, detail=f'PV {name} not found')
+    snapshots = await CONTROLLER.get().volume_snapshots(pv.volume) if pv.volume else []
+    return PVDetails(cluster=cluster, pv=pv, snapshots=snapshots)
+
+
+async def cmd_get_volumes(msg: dict, out_queue: asyncio.Queue):
+    await CONTROLLER.get().describe_volumes()
+
+
+async def cmd_get_snapshots(msg: dict, out_queue: asyncio.Queue):
+    await CONTROLLER.get().describe_snapshots(reset=msg.get('force'))
+
+
+async def cmd_snapshot_fill_tags(msg: dict, out_queue: asyncio.Queue):
+    c = CONTROLLER.get()
+    description = msg['description']
+    volume_id = description.split()[-1]
+    assert volume_id.startswith('vol-')
+
+    kc = get_kube_controller(msg)
+    pv_by_volume = await kc.pv_by_volume()
+    pv = pv_by_volume.get(volume_id)
+    if not pv:
+        log.warning(f'No PV for {volume_id=}')
+        return
+    claim_ref = pv.spec.claim_ref
+    tags = {'namespace': claim_ref.namespace, 'name': claim_ref.name}
+    await c.set_tags(msg['snap_id'], tags)
+    await c.describe_snapshots(reset=True)
+
+
+async def cmd_get_pvs(msg: dict, out_queue: asyncio.Queue):
+    cluster = msg.get('cluster', 'kube1')
+    kc = get_kube_controller(msg)
+    pvs = await kc.get_pvs()
+    out_queue.put_nowait(PVsEvent(cluster=cluster, pvs=pvs, request_id=msg['request_id']))
+
+
+async def cmd_create_snapshot(msg: dict, out_queue: asyncio.Queue):
+    kc = get_kube_controller(msg)
+    log.debug(f'got {kc=}')
+    await kc.create_pv_snapshot(msg['pvid'], f'snapshot-{msg["pvid"]}')
+    CONTROLLER.get().reset_details()
+
+
+async def cmd_delete_snapshot(msg: dict, out_queue: asyncio.Queue):
+    kc = get_kube_controller(msg, 'kube1')
+    await kc.delete_snapshot_by_snapid(msg['snap_id'])
+    CONTROLLER.get().reset_details()
+
+
+async def cmd_snapshot_toggle_deletion_policy(msg: dict, out_queue: asyncio.Queue):
+    kc = get_kube_controller(msg, 'kube1')
+    await kc.snapshot_toggle_deletion_policy(msg['snap_id'])
+    await CONTROLLER.get().describe_snapshots(reset=True)
+
+
+WS_COMMANDS = {
+    'get_volumes': cmd_get_volumes,
+    'get_snapshots': cmd_get_snapshots,
+    'snapshot_fill_tags': cmd_snapshot_fill_tags,
+    'get_pvs': cmd_get_pvs,
+    'create_snapshot': cmd_create_snapshot,
+    'delete_snapshot': cmd_delete_snapshot,
+    'snapshot_toggle_deletion_policy': cmd_snapshot_toggle_deletion_policy,
+}
+
+
+# mutating commands => message field with the object they change
+WS_EXCLUSIVE = {
+    'snapshot_fill_tags': 'snap_id',
+    'create_snapshot': 'pvid',
+    'delete_snapshot': 'snap_id',
+    'snapshot_toggle_deletion_policy': 'snap_id',
+}
+# shared by all connections, so two tabs don't race on the same object
+WS_LOCKS = {}
+
+
 @root.websocket('/api/ws')
 async def ws(sock: WebSocket):
     c = CONTROLLER.get()
     out_queue = asyncio.Queue()
     unsubscribe = c.subscribe(out_queue)
+    dispatcher = CommandDispatcher(
+        WS_COMMANDS,
+        out_queue,
+        max_concurrency=config.WS_MAX_CONCURRENCY,
+        exclusive=WS_EXCLUSIVE,
+        locks=WS_LOCKS,
+    )
 
     await sock.accept()
     await sock.send_json({'event': 'echo'})
 
     async def out_loop():
         while True:
-            event: BaseModel = await out_queue.get()
+            # published events come serialized, command replies as models
+            event: BaseModel | str = await out_queue.get()
             if event is None:
                 return
             if sock.client_state == WebSocketState.DISCONNECTED:
                 return
-            await sock.send_text(event.json())
+            await sock.send_text(event if isinstance(event, str) else event.json())
 
     loop = asyncio.create_task(out_loop())
 
     try:
-        await c.describe_volumes()
+        dispatcher.dispatch({'event': 'get_volumes'})
         while True:
             msg = await sock.receive_json()
-            if msg['event'] == 'get_snapshots':
-                await c.describe_snapshots(reset=msg.get('force'))
-            elif msg['event'] == 'snapshot_fill_tags':
-                description = msg['description']
-                volume_id = description.split()[-1]
-                assert volume_id.startswith('vol-')
-
-                kc = get_kube_controller(msg)
-                pv_by_volume = await kc.pv_by_volume()
-                pv = pv_by_volume.get(volume_id)
-                if not pv:
-                    log.warning(f'No PV for {volume_id=}')
-                    continue
-                claim_ref = pv.spec.claim_ref
-                tags = {'namespace': claim_ref.namespace, 'name': claim_ref.name}
-                await c.set_tags(msg['snap_id'], tags)
-                await c.describe_snapshots(reset=True)
-
-            elif msg['event'] == 'get_pvs':
-                cluster = msg.get('cluster', 'kube1')
-                kc = get_kube_controller(msg)
-                pvs = await kc.get_pvs()
-                await sock.send_text(
-                    json.dumps(
-                        {'event': 'pvs', 'pvs': [pv.dict() for pv in pvs], 'cluster': cluster}
-                    )
-                )
-            elif msg['event'] == 'create_snapshot':
-                kc = get_kube_controller(msg)
-                log.debug(f'got {kc=}')
-                await kc.create_pv_snapshot(msg['pvid'], f'snapshot-{msg["pvid"]}')
-            elif msg['event'] == 'delete_snapshot':
-                kc = get_kube_controller(msg, 'kube1')
-                # await kc.get_snapshot_by_snapid(msg['snap_id'])
-                await kc.delete_snapshot_by_snapid(msg['snap_id'])
-            elif msg['event'] == 'snapshot_toggle_deletion_policy':
-                kc = get_kube_controller(msg, 'kube1')
-                await kc.snapshot_toggle_deletion_policy(msg['snap_id'])
-                c.aws_describe_snapshots.reset_cache()
-                await c.describe_snapshots()
-            else:
-                log.info(f'Unknown message: {msg}')
+            dispatcher.dispatch(msg)
     except WebSocketDisconnect:
         log.debug('disconnected')
     finally:
         unsubscribe()
+        await dispatcher.cancel_all()
         loop.cancel()
 
 
@@ -152,6 +221,8 @@ async def setup_controllers():
     await kc2.start()
     c.add_cluster(kc2)
 
+    c.start_warm_up()
+
 
 async def shutdown_controllers():
     c = CONTROLLER.get()
@@ -160,6 +231,7 @@ async def shutdown_controllers():
     await kc1.stop()
     kc2 = KUBE_CONTROLLER2.get()
     await kc2.stop()
+    await shutdown_tracing()
 
 
 async def errors_loggin_middleware(request: Request, call_next):
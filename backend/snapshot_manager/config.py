@@ -7,3 +7,12 @@ from snapshot_manager import logs  # noqa
 class Config(BaseSettings):
     KUBECONFIG1: Path
     KUBECONFIG2: Path
+    # seconds before pushed inventory is marked stale and revalidated
+    INVENTORY_MAX_STALENESS: int = 300
+    # commands of a single websocket connection running at the same time
+    WS_MAX_CONCURRENCY: int = 4
+    # traces slower than this (seconds) are logged as span tree, 0 disables
+    TRACE_SLOW_THRESHOLD: float = 5.0
+    # OTLP JSON export: append to a local file and/or post to collector (http://host:4318)
+    TRACE_EXPORT_FILE: Path | None = None
+    TRACE_OTLP_ENDPOINT: str | None = None
@@ -1,14 +1,19 @@
+import asyncio
 import logging
-from asyncio import Queue
+from asyncio import Queue, shield, Task
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Callable, TYPE_CHECKING
 
 import aioboto3
+from botocore.exceptions import ClientError
 from pydantic import BaseModel
 
 from fan_tools.python import cache_async as cache
 
 from .models import SnaphotsEvent, Snapshot, Snapshots, Volume, Volumes, VolumesEvent
+from .tracing import span, traced_pages
+from .ttl_cache import ttl_lru_cache
 
 
 if TYPE_CHECKING:
@@ -21,19 +26,32 @@ cache_dir.mkdir(exist_ok=True)
 
 
 class AWSController:
-    def __init__(self, volumes=None, snapshots=None, cache_dir=cache_dir):
+    def __init__(self, volumes=None, snapshots=None, cache_dir=cache_dir, max_staleness=300):
         self.session = aioboto3.Session()
         self.ec2_resource = self.session.resource('ec2')
 
         self._volumes_file = cache_dir / 'volumes.json'
-        self.aws_describe_volumes = cache[type(Volumes)](self._volumes_file, Volumes, {})(
-            self._aws_describe_volumes
-        )
+        self._volumes_cache = cache[type(Volumes)](self._volumes_file, Volumes, {})
+        self.aws_describe_volumes = self._volumes_cache(self._aws_describe_volumes)
 
         self._snapshots_file = cache_dir / 'snapshots.json'
-        self.aws_describe_snapshots = cache[type(Snapshots)](self._snapshots_file, Snapshots, {})(
-            self._aws_describe_snapshots
-        )
+        self._snapshots_cache = cache[type(Snapshots)](self._snapshots_file, Snapshots, {})
+        self.aws_describe_snapshots = self._snapshots_cache(self._aws_describe_snapshots)
+
+        # indexes from the last full describe, used by detail lookups
+        self.volumes_index: dict[str, Volume] = {}
+        self.snapshots_index: dict[str, Snapshot] = {}
+        self.get_snapshot = ttl_lru_cache(maxsize=256, ttl=30)(self._get_snapshot)
+        self.volume_snapshots = ttl_lru_cache(maxsize=256, ttl=30)(self._volume_snapshots)
+
+        # stale-while-revalidate state: inventory older than max_staleness (seconds)
+        # is still served, but marked stale and refreshed in background
+        self.max_staleness = max_staleness
+        self.inventory: dict[str, Volumes | Snapshots] = {}
+        self.refreshed_at: dict[str, datetime] = {}
+        self.refresh_tasks: dict[str, Task] = {}
+        self.refresh_pending: set[str] = set()
+        self.warm_up_task: Task | None = None
 
         self.subscribers = {}
         self.clusters = {}
@@ -51,9 +69,15 @@ class AWSController:
         return unsubscribe
 
     def publish(self, event: BaseModel):
-        for q in self.subscribers:
-            log.debug(f'Publish to WS-queue: {event.event} / {id(q)}')
-            q.put_nowait(event)
+        if not self.subscribers:
+            return
+        with span('publish', event=event.event, subscribers=len(self.subscribers)):
+            # serialize once for all websocket queues
+            with span('serialize', event=event.event):
+                text = event.json()
+            for q in self.subscribers:
+                log.debug(f'Publish to WS-queue: {event.event} / {id(q)}')
+                q.put_nowait(text)
 
     async def volume_to_dict(self, volume) -> Volume:
         attachments = await volume.attachments
@@ -101,32 +125,43 @@ class AWSController:
     async def _aws_describe_volumes(self) -> Volumes:
         log.debug('AWS describe volumes')
         resp = {}
-        async for volume in self.ec2.volumes.all():
-            data = await self.volume_to_dict(volume)
-            resp[volume.id] = data
-        resp = Volumes(__root__=resp)
+        volumes = []
+        async for page in traced_pages('ec2.describe_volumes.page', self.ec2.volumes.all().pages()):
+            volumes.extend(page)
+        # one span for all per-volume snapshot lookups, not one per volume
+        with span('ec2.volume_snapshots', volumes=len(volumes)) as lookups:
+            for volume in volumes:
+                data = await self.volume_to_dict(volume)
+                resp[volume.id] = data
+            lookups.set_attribute('snapshots', sum(len(v.snapshots) for v in resp.values()))
+        with span('build.volumes', volumes=len(resp)):
+            resp = Volumes(__root__=resp)
         return resp
 
-    async def describe_volumes(self) -> Volumes:
-        resp = await self.aws_describe_volumes()
-        self.publish(VolumesEvent(volumes=resp))
-        return resp
+    async def describe_volumes(self, force=False) -> Volumes:
+        return await self.describe('volumes', force)
 
     async def _aws_describe_snapshots(self) -> Snapshots:
         log.debug('AWS describe snapshots')
         resp = {}
         snaps_by_cluster = {}
         for name, cluster in self.clusters.items():
-            snaps_by_cluster[name] = await cluster.snapshots_by_snapid()
+            with span('kube.snapshots_by_snapid', cluster=name):
+                snaps_by_cluster[name] = await cluster.snapshots_by_snapid()
+
+        pages = self.ec2.snapshots.filter(OwnerIds=['self']).pages()
+        async for page in traced_pages('ec2.describe_snapshots.page', pages):
+            for snapshot in page:
+                resp[snapshot.id] = await self.snapshot_to_dict(snapshot)
 
-        async for snapshot in self.ec2.snapshots.filter(OwnerIds=['self']):
-            data = await self.snapshot_to_dict(snapshot)
-            resp[snapshot.id] = data
-            for name, snaps in snaps_by_cluster.items():
-                if snapshot.id in snaps:
-                    data.clusters.append({'cluster': name, 'snapshot': snaps[snapshot.id]})
+        with span('join.cluster_bindings', snapshots=len(resp)):
+            for snap_id, data in resp.items():
+                for name, snaps in snaps_by_cluster.items():
+                    if snap_id in snaps:
+                        data.clusters.append({'cluster': name, 'snapshot': snaps[snap_id]})
 
-        resp = Snapshots(__root__=resp)
+        with span('build.snapshots', snapshots=len(resp)):
+            resp = Snapshots(__root__=resp)
         return resp
 
     async def set_tags(self, snap_id: str, tags: dict[str, str]):
@@ -134,12 +169,157 @@ class AWSController:
         await snapshot.create_tags(Tags=[{'Key': k, 'Value': v} for k, v in tags.items()])
 
     async def describe_snapshots(self, reset=False) -> Snapshots:
-        if reset:
-            self.aws_describe_snapshots.reset_cache()
-        resp = await self.aws_describe_snapshots()
-        self.publish(SnaphotsEvent(snapshots=resp))
+        return await self.describe('snapshots', reset)
+
+    def is_stale(self, kind: str) -> bool:
+        age = datetime.now(timezone.utc) - self.refreshed_at[kind]
+        return age.total_seconds() > self.max_staleness
+
+    def make_event(self, kind: str, stale=False) -> VolumesEvent | SnaphotsEvent:
+        if kind == 'volumes':
+            event_cls, field = VolumesEvent, 'volumes'
+        else:
+            event_cls, field = SnaphotsEvent, 'snapshots'
+        return event_cls(
+            **{field: self.inventory[kind]},
+            stale=stale,
+            refreshed_at=self.refreshed_at[kind],
+        )
+
+    async def describe(self, kind: str, force=False) -> Volumes | Snapshots:
+        """
+        serve inventory immediately and revalidate it in background when
+        forced or older than max_staleness. Only a cold start waits for AWS.
+        """
+        if kind not in self.inventory:
+            await shield(self.start_refresh(kind, reset=force))
+            if self.is_stale(kind):
+                # file cache left by a previous run
+                self.start_refresh(kind, reset=True)
+        elif force or self.is_stale(kind):
+            self.start_refresh(kind, reset=True)
+            self.publish(self.make_event(kind, stale=True))
+        else:
+            self.publish(self.make_event(kind))
+        return self.inventory[kind]
+
+    def start_refresh(self, kind: str, reset=True) -> Task:
+        task = self.refresh_tasks.get(kind)
+        if task and not task.done():
+            if reset:
+                # data may have changed after the running refresh has started
+                self.refresh_pending.add(kind)
+            return task
+        task = asyncio.create_task(self._refresh(kind, reset))
+        task.add_done_callback(self._log_refresh_error)
+        self.refresh_tasks[kind] = task
+        return task
+
+    def _log_refresh_error(self, task: Task):
+        if not task.cancelled() and task.exception():
+            log.error(f'Inventory refresh failed: {task.exception()!r}')
+
+    async def _refresh(self, kind: str, reset: bool):
+        if kind == 'volumes':
+            describe, fetch = self.aws_describe_volumes, self._aws_describe_volumes
+            file_cache = self._volumes_cache
+        else:
+            describe, fetch = self.aws_describe_snapshots, self._aws_describe_snapshots
+            file_cache = self._snapshots_cache
+        cache_file = file_cache.fname
+
+        with span('inventory.refresh', kind=kind, reset=reset):
+            while True:
+                self.refresh_pending.discard(kind)
+                with span('describe', kind=kind):
+                    if reset:
+                        # reset_cache() would delete the file before AWS answers,
+                        # so a failed revalidation would leave the next start cold
+                        resp = await fetch()
+                        self._store_file_cache(file_cache, resp)
+                    else:
+                        resp = await describe()
+                if not reset and cache_file.exists():
+                    # loaded from file cache on cold start, it is as old as the file
+                    mtime = cache_file.stat().st_mtime
+                    self.refreshed_at[kind] = datetime.fromtimestamp(mtime, timezone.utc)
+                else:
+                    self.refreshed_at[kind] = datetime.now(timezone.utc)
+                self.inventory[kind] = resp
+
+                if kind == 'volumes':
+                    self.volumes_index = resp.__root__
+                    self.volume_snapshots.reset_cache()
+                else:
+                    self.snapshots_index = resp.__root__
+                    self.reset_details()
+
+                if kind not in self.refresh_pending:
+                    break
+                reset = True
+
+            with span('build.event', kind=kind):
+                event = self.make_event(kind, stale=self.is_stale(kind))
+            self.publish(event)
         return resp
 
+    def start_warm_up(self) -> Task:
+        if not self.warm_up_task or self.warm_up_task.done():
+            self.warm_up_task = asyncio.create_task(self.warm_up())
+        return self.warm_up_task
+
+    def _store_file_cache(self, file_cache: cache, resp: Volumes | Snapshots):
+        file_cache.cache = resp
+        tmp_file = file_cache.fname.with_suffix('.tmp')
+        tmp_file.write_text(resp.json())
+        tmp_file.replace(file_cache.fname)
+
+    async def warm_up(self):
+        """
+        load inventory before the first client asks, stale file cache is revalidated
+        """
+        for kind in ('volumes', 'snapshots'):
+            try:
+                await self.describe(kind)
+            except Exception as e:
+                log.exception(f'Warm-up of {kind} failed: {e}')
+
+    def reset_details(self):
+        """
+        drop cached per-object details after snapshots were changed
+        """
+        self.get_snapshot.reset_cache()
+        self.volume_snapshots.reset_cache()
+        for cluster in self.clusters.values():
+            cluster.reset_details()
+
+    async def _get_snapshot(self, snap_id: str) -> Snapshot | None:
+        """
+        single snapshot with cluster bindings, without full describe_snapshots
+        """
+        if snap_id in self.snapshots_index:
+            return self.snapshots_index[snap_id]
+
+        log.debug(f'AWS describe snapshot {snap_id}')
+        try:
+            data = await self.snapshot_to_dict(await self.ec2.Snapshot(snap_id))
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('InvalidSnapshot.NotFound', 'InvalidSnapshotID.Malformed'):
+                return None
+            raise
+
+        for name, cluster in self.clusters.items():
+            snaps = await cluster.cached_snapshots_by_snapid()
+            if snap_id in snaps:
+                data.clusters.append({'cluster': name, 'snapshot': snaps[snap_id]})
+        return data
+
+    async def _volume_snapshots(self, volume_id: str) -> list[Snapshot]:
+        if volume_id in self.volumes_index:
+            return self.volumes_index[volume_id].snapshots
+        return await self.get_volume_snapshots(volume_id)
+
     async def snapshot_to_dict(self, snapshot) -> Snapshot:
         tags = {tag['Key']: tag['Value'] for tag in (await snapshot.tags) or {}}
         return Snapshot(
@@ -167,4 +347,9 @@ class AWSController:
 
     async def shutdown(self):
         log.debug('shutting down...')
+        tasks = [t for t in [self.warm_up_task, *self.refresh_tasks.values()] if t]
+        for task in tasks:
+            task.cancel()
+        # cancelled refreshes may still use the ec2 client
+        await asyncio.gather(*tasks, return_exceptions=True)
         await self.ec2_resource.__aexit__(None, None, None)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from asyncio import CancelledError, Lock, Queue, Semaphore, Task
+from contextlib import AsyncExitStack
+from itertools import count
+from typing import Awaitable, Callable
+
+from .models import CommandResult
+
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[dict, Queue], Awaitable[None]]
+
+
+class CommandDispatcher:
+    """
+    runs websocket commands of a single connection as tracked tasks,
+    so a slow command doesn't block the receive loop
+
+    `exclusive` maps mutating commands to the message field with the object id,
+    commands for the same object run one after another in arrival order.
+    Pass the same `locks` dict to all dispatchers to serialize across connections
+    """
+
+    def __init__(
+        self,
+        handlers: dict[str, Handler],
+        out_queue: Queue,
+        max_concurrency=4,
+        exclusive: dict[str, str] | None = None,
+        locks: dict[str, Lock] | None = None,
+    ):
+        self.handlers = handlers
+        self.out_queue = out_queue
+        self.semaphore = Semaphore(max_concurrency)
+        self.exclusive = exclusive or {}
+        self.locks = {} if locks is None else locks
+        self.tasks: dict[str, Task] = {}
+        self._ids = count(1)
+
+    def dispatch(self, msg: dict) -> str | None:
+        command = msg.get('event')
+        if command == 'cancel':
+            request_id = str(msg.get('request_id'))
+            if not self.cancel(request_id):
+                self._reject(request_id, command, f'Unknown request_id: {request_id}')
+            return None
+        request_id = str(msg.get('request_id') or f'srv-{next(self._ids)}')
+        handler = self.handlers.get(command)
+        if not handler:
+            log.info(f'Unknown message: {msg}')
+            self._reject(request_id, command, f'Unknown command: {command}')
+            return None
+        if request_id in self.tasks:
+            log.info(f'Duplicate {request_id=} for {command=}')
+            self._reject(request_id, command, f'Duplicate request_id: {request_id}')
+            return None
+        msg = {**msg, 'request_id': request_id}
+        task = asyncio.create_task(self._run(handler, command, request_id, msg))
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(request_id, None))
+        return request_id
+
+    def _reject(self, request_id: str, command: str | None, error: str):
+        self.out_queue.put_nowait(
+            CommandResult(request_id=request_id, command=str(command), status='error', error=error)
+        )
+
+    async def _run(self, handler: Handler, command: str, request_id: str, msg: dict):
+        result = CommandResult(request_id=request_id, command=command)
+        try:
+            async with AsyncExitStack() as stack:
+                # object lock first: tasks start in dispatch order, so the order is kept
+                if command in self.exclusive:
+                    field = self.exclusive[command]
+                    lock = self.locks.setdefault(f'{field}:{msg.get(field)}', Lock())
+                    await stack.enter_async_context(lock)
+                await stack.enter_async_context(self.semaphore)
+                log.debug(f'Run {command=} {request_id=}')
+                await handler(msg, self.out_queue)
+        except CancelledError:
+            result.status = 'cancelled'
+            self.out_queue.put_nowait(result)
+            raise
+        except Exception as e:
+            log.exception(f'Command failed: {command=} {request_id=} {e}')
+            result.status = 'error'
+            result.error = str(e)
+        self.out_queue.put_nowait(result)
+
+    def cancel(self, request_id: str) -> bool:
+        task = self.tasks.get(request_id)
+        if not task:
+            return False
+        task.cancel()
+        return True
+
+    async def cancel_all(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -3,6 +3,8 @@ import asyncio
 from asyncio import CancelledError, shield, Task
 from typing import Optional
 
+from snapshot_manager.tracing import span
+
 
 log = logging.getLogger(__name__)
 
@@ -64,7 +66,8 @@ class Controller:
         try:
             while not self.stopping:
                 try:
-                    await asyncio.wait_for(self.loop_iteration(), timeout=self.loop_timeout)
+                    with span('loop_iteration', controller=type(self).__name__):
+                        await asyncio.wait_for(self.loop_iteration(), timeout=self.loop_timeout)
                     await asyncio.sleep(self.get_loop_interval())
                 except CancelledError:
                     log.debug(f'Cancelled loop: {self}')
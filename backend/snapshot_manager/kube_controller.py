@@ -6,7 +6,9 @@ from kubernetes_asyncio.client.api_client import ApiClient
 from kubernetes_asyncio.client.exceptions import ApiException
 
 from snapshot_manager.generic_controller import Controller
+from snapshot_manager.tracing import span
 from .models import PV
+from .ttl_cache import ttl_lru_cache
 
 
 log = logging.getLogger(__name__)
@@ -17,11 +19,16 @@ class KubeController(Controller):
         self.name = name
         assert config_path.exists(), f'Config file {config_path} does not exist'
         self.config_path = config_path
+        self.cached_snapshots_by_snapid = ttl_lru_cache(maxsize=1, ttl=30)(
+            self.snapshots_by_snapid
+        )
+        self.get_pv = ttl_lru_cache(maxsize=128, ttl=30)(self._get_pv)
         super().__init__()
 
     async def loop_iteration(self):
         v1 = client.CoreV1Api(self.api)
-        nodes = await v1.list_node()
+        with span('kube.list_node', cluster=self.name):
+            nodes = await v1.list_node()
         for node in nodes.items:
             log.debug(f'{self.name}: node={node.metadata.name} kubelet={node.status.node_info.kubelet_version}')
 
@@ -46,33 +53,54 @@ class KubeController(Controller):
 
     async def get_pvs(self) -> list[PV]:
         v1 = client.CoreV1Api(self.api)
-        pv_list = await v1.list_persistent_volume()
+        with span('kube.list_persistent_volume', cluster=self.name):
+            pv_list = await v1.list_persistent_volume()
         out = []
         for pv in pv_list.items:
-            log.debug(
-                f'pv={pv.metadata.name} status={pv.status.phase} pvc={pv.spec.claim_ref.name}'
-            )
-            if not pv.spec.csi:
-                volume_handle = pv.spec.aws_elastic_block_store.volume_id
-            else:
-                volume_handle = pv.spec.csi.volume_handle
-            out.append(
-                PV(
-                    name=pv.metadata.name,
-                    namespace=pv.spec.claim_ref.namespace,
-                    capacity=pv.spec.capacity['storage'],
-                    access_modes=pv.spec.access_modes,
-                    reclaim_policy=pv.spec.persistent_volume_reclaim_policy,
-                    volume_mode=pv.spec.volume_mode,
-                    status=pv.status.phase,
-                    claim=pv.spec.claim_ref.name if pv.spec.claim_ref else '',
-                    storage_class=pv.spec.storage_class_name,
-                    # eg. volume_handle=vol-041085bbe47495fc7
-                    volume=volume_handle,
-                )
-            )
+            claim = pv.spec.claim_ref.name if pv.spec.claim_ref else None
+            log.debug(f'pv={pv.metadata.name} status={pv.status.phase} pvc={claim}')
+            out.append(self.pv_to_model(pv))
         return out
 
+    def pv_to_model(self, pv) -> PV:
+        if pv.spec.csi:
+            volume_handle = pv.spec.csi.volume_handle
+        elif pv.spec.aws_elastic_block_store:
+            volume_handle = pv.spec.aws_elastic_block_store.volume_id
+        else:
+            # not an EBS volume
+            volume_handle = ''
+        return PV(
+            name=pv.metadata.name,
+            namespace=pv.spec.claim_ref.namespace if pv.spec.claim_ref else '',
+            capacity=pv.spec.capacity['storage'],
+            access_modes=pv.spec.access_modes,
+            reclaim_policy=pv.spec.persistent_volume_reclaim_policy,
+            volume_mode=pv.spec.volume_mode,
+            status=pv.status.phase,
+            claim=pv.spec.claim_ref.name if pv.spec.claim_ref else '',
+            storage_class=pv.spec.storage_class_name,
+            # eg. volume_handle=vol-041085bbe47495fc7
+            volume=volume_handle,
+        )
+
+    async def _get_pv(self, name: str) -> PV | None:
+        """
+        read single PV by name instead of listing all of them
+        """
+        v1 = client.CoreV1Api(self.api)
+        try:
+            pv = await v1.read_persistent_volume(name)
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+        return self.pv_to_model(pv)
+
+    def reset_details(self):
+        self.cached_snapshots_by_snapid.reset_cache()
+        self.get_pv.reset_cache()
+
     async def get_pv_byid(self, pvid) -> PV | None:
         pv_list = await self.get_pvs()
         for pv in pv_list:
@@ -106,6 +134,7 @@ class KubeController(Controller):
                 },
             },
         )
+        self.reset_details()
 
     async def snapshots_by_snapid(self):
         """
@@ -115,29 +144,32 @@ class KubeController(Controller):
         crd = client.CustomObjectsApi(self.api)
         # check if 'snaphot.storage.k8s.io' is installed
         try:
-            contents = await crd.list_cluster_custom_object(
-                group='snapshot.storage.k8s.io', version='v1', plural='volumesnapshotcontents'
-            )
+            with span('kube.list volumesnapshotcontents', cluster=self.name):
+                contents = await crd.list_cluster_custom_object(
+                    group='snapshot.storage.k8s.io', version='v1', plural='volumesnapshotcontents'
+                )
         except ApiException as e:
             if e.status == 404:
                 log.info('snapshot.storage.k8s.io not installed')
                 return {}
             raise
-        snapshots = await crd.list_cluster_custom_object(
-            group='snapshot.storage.k8s.io', version='v1', plural='volumesnapshots'
-        )
+        with span('kube.list volumesnapshots', cluster=self.name):
+            snapshots = await crd.list_cluster_custom_object(
+                group='snapshot.storage.k8s.io', version='v1', plural='volumesnapshots'
+            )
         # snapshot['status']['boundVolumeSnapshotContentName'] == content['metadata']['name']
         # snap_id == content['status']['snapshotHandle']
         # snap_id => snapshot
-        name_to_content = {}
-        for content in contents['items']:
-            name_to_content[content['metadata']['name']] = content
-        snap_id_to_snapshot = {}
-        for snapshot in snapshots['items']:
-            content = name_to_content[snapshot['status']['boundVolumeSnapshotContentName']]
-            snap_id_to_snapshot[content['status']['snapshotHandle']] = snapshot
-            snapshot['content'] = content
-            snapshot['deletion_policy'] = content['spec']['deletionPolicy']
+        with span('join.volumesnapshots', cluster=self.name, items=len(snapshots['items'])):
+            name_to_content = {}
+            for content in contents['items']:
+                name_to_content[content['metadata']['name']] = content
+            snap_id_to_snapshot = {}
+            for snapshot in snapshots['items']:
+                content = name_to_content[snapshot['status']['boundVolumeSnapshotContentName']]
+                snap_id_to_snapshot[content['status']['snapshotHandle']] = snapshot
+                snapshot['content'] = content
+                snapshot['deletion_policy'] = content['spec']['deletionPolicy']
         return snap_id_to_snapshot
 
     async def pv_by_volume(self):
@@ -177,6 +209,7 @@ class KubeController(Controller):
             name=snap['metadata']['name'],
             body=client.V1DeleteOptions(),
         )
+        self.reset_details()
 
     async def snapshot_toggle_deletion_policy(self, snap_id: str):
         """
@@ -206,6 +239,7 @@ class KubeController(Controller):
             name=name,
             body={'spec': {'deletionPolicy': new_policy}},
         )
+        self.cached_snapshots_by_snapid.reset_cache()
 
     async def shutdown(self):
         pass
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -20,6 +22,8 @@ class Snapshots(BaseModel):
 class SnaphotsEvent(BaseModel):
     event: str = 'snapshots'
     snapshots: Snapshots
+    stale: bool = False
+    refreshed_at: datetime | None = None
 
 
 class Volume(BaseModel):
@@ -43,6 +47,8 @@ class Volumes(BaseModel):
 class VolumesEvent(BaseModel):
     event: str = 'volumes'
     volumes: Volumes
+    stale: bool = False
+    refreshed_at: datetime | None = None
 
 
 class PV(BaseModel):
@@ -56,3 +62,24 @@ class PV(BaseModel):
     claim: str
     storage_class: str
     volume: str
+
+
+class PVDetails(BaseModel):
+    cluster: str
+    pv: PV
+    snapshots: list[Snapshot]
+
+
+class PVsEvent(BaseModel):
+    event: str = 'pvs'
+    cluster: str
+    pvs: list[PV]
+    request_id: str | None = None
+
+
+class CommandResult(BaseModel):
+    event: str = 'command_result'
+    request_id: str
+    command: str
+    status: str = 'ok'
+    error: str | None = None
@@ -0,0 +1,255 @@
+"""
+lightweight tracing: nested spans kept in a context var
+
+finished traces are exported in batches as OTLP JSON (one `resourceSpans` document
+per line to a file, and/or POSTed to a collector `/v1/traces`) and traces slower than
+`slow_threshold` seconds are logged as a span tree
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import httpx
+
+
+log = logging.getLogger(__name__)
+
+CURRENT_SPAN: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+SERVICE_NAME = 'snapshot_manager'
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent: Optional['Span'] = None
+    attributes: dict = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    error: str | None = None
+    children: list['Span'] = field(default_factory=list)
+    dropped: bool = False
+
+    @property
+    def duration(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def drop(self):
+        """
+        don't record this span, eg. nothing happened inside it
+        """
+        self.dropped = True
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def format_tree(self, indent=0) -> str:
+        attrs = ' '.join(f'{k}={v}' for k, v in self.attributes.items())
+        error = f' error={self.error}' if self.error else ''
+        lines = [f'{"  " * indent}{self.name} {self.duration:.3f}s {attrs}{error}'.rstrip()]
+        for child in self.children:
+            lines.append(child.format_tree(indent + 1))
+        return '\n'.join(lines)
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [
+                {'key': k, 'value': {'stringValue': str(v)}} for k, v in self.attributes.items()
+            ],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent:
+            span['parentSpanId'] = self.parent.span_id
+        return span
+
+
+class BatchExporter:
+    """
+    buffers finished spans and sends them in batches from a background task,
+    to a file (written in a thread) and/or an OTLP/HTTP collector
+    """
+
+    def __init__(
+        self,
+        export_file: Path | None = None,
+        otlp_endpoint: str | None = None,
+        batch_size=512,
+        interval=5.0,
+        max_buffer=10_000,
+    ):
+        self.export_file = export_file
+        self.url = otlp_endpoint.rstrip('/') + '/v1/traces' if otlp_endpoint else None
+        self.batch_size = batch_size
+        self.interval = interval
+        # oldest spans are dropped when the collector is not reachable
+        self.buffer: deque[dict] = deque(maxlen=max_buffer)
+        self.wakeup = asyncio.Event()
+        self.client: httpx.AsyncClient | None = None
+        self.task: asyncio.Task | None = None
+
+    def export(self, spans: list[dict]):
+        self.buffer.extend(spans)
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._loop())
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+            document = make_document(batch)
+            if self.export_file:
+                try:
+                    await asyncio.to_thread(self._write, json.dumps(document))
+                except OSError as e:
+                    log.warning(f'Cannot export traces to {self.export_file}: {e!r}')
+            if self.url:
+                await self._post(document)
+
+    def _write(self, line: str):
+        with self.export_file.open('a') as f:
+            f.write(line + '\n')
+
+    async def _post(self, document: dict):
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=5)
+        try:
+            resp = await self.client.post(self.url, json=document)
+        except httpx.HTTPError as e:
+            log.warning(f'Cannot export traces to {self.url}: {e!r}')
+            return
+        if resp.status_code >= 400:
+            log.warning(f'Collector rejected traces: {self.url} {resp.status_code} {resp.text}')
+
+    async def shutdown(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+
+def make_document(spans: list[dict]) -> dict:
+    return {
+        'resourceSpans': [
+            {
+                'resource': {
+                    'attributes': [
+                        {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}
+                    ]
+                },
+                'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+            }
+        ]
+    }
+
+
+class Tracer:
+    def __init__(self, slow_threshold: float = 5.0, exporter: BatchExporter | None = None):
+        self.slow_threshold = slow_threshold
+        self.exporter = exporter
+
+    def finish_trace(self, root: Span):
+        if self.slow_threshold and root.duration >= self.slow_threshold:
+            log.warning(f'Slow operation {root.name} {root.duration:.3f}s:\n{root.format_tree()}')
+        if self.exporter:
+            self.exporter.export([s.to_otlp() for s in root.walk()])
+
+
+TRACER = Tracer()
+
+
+def configure(slow_threshold: float, export_file: Path | None = None, otlp_endpoint=None):
+    TRACER.slow_threshold = slow_threshold
+    if export_file or otlp_endpoint:
+        TRACER.exporter = BatchExporter(export_file=export_file, otlp_endpoint=otlp_endpoint)
+    else:
+        TRACER.exporter = None
+
+
+async def shutdown():
+    """
+    send buffered spans and close the collector client
+    """
+    if TRACER.exporter:
+        await TRACER.exporter.shutdown()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = CURRENT_SPAN.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+        span_id=os.urandom(8).hex(),
+        parent=parent,
+        attributes=attributes,
+    )
+    if parent:
+        parent.children.append(current)
+    token = CURRENT_SPAN.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        CURRENT_SPAN.reset(token)
+        if current.dropped:
+            if parent:
+                parent.children.remove(current)
+        elif parent is None:
+            TRACER.finish_trace(current)
+
+
+async def traced_pages(name: str, pages, **attributes) -> AsyncIterator[list]:
+    """
+    iterate over paginated API results, each page fetch is a separate span
+    """
+    iterator = pages.__aiter__()
+    index = 0
+    while True:
+        with span(name, page=index, **attributes) as page_span:
+            try:
+                page = await iterator.__anext__()
+            except StopAsyncIteration:
+                # paginator is exhausted, there was no request
+                page_span.drop()
+                return
+            page_span.set_attribute('items', len(page))
+        yield page
+        index += 1
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable
+
+
+def ttl_lru_cache(maxsize: int = 128, ttl: float = 30):
+    """
+    in-memory LRU cache for async callables, entries expire after `ttl` seconds
+
+    concurrent calls with the same arguments share a single in-flight task,
+    cancelling one caller doesn't cancel the others. `None` results (not found)
+    are not cached, so new objects are visible right away
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        inflight: dict[tuple, asyncio.Task] = {}
+        # bumped on reset, results of calls started before reset are not stored
+        generation = 0
+
+        async def run(key: tuple, started_generation: int, args, kwargs):
+            try:
+                value = await func(*args, **kwargs)
+            finally:
+                if inflight.get(key) is asyncio.current_task():
+                    del inflight[key]
+            if value is not None and started_generation == generation:
+                entries[key] = (time.monotonic() + ttl, value)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return value
+
+        def consume_exception(task: asyncio.Task):
+            # avoid "exception was never retrieved" when all callers are gone
+            if not task.cancelled():
+                task.exception()
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            if key in entries:
+                expires_at, value = entries[key]
+                if expires_at > time.monotonic():
+                    entries.move_to_end(key)
+                    return value
+                del entries[key]
+
+            task = inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(run(key, generation, args, kwargs))
+                task.add_done_callback(consume_exception)
+                inflight[key] = task
+            return await asyncio.shield(task)
+
+        def reset_cache():
+            nonlocal generation
+            generation += 1
+            entries.clear()
+            inflight.clear()
+
+        wrapper.reset_cache = reset_cache
+        return wrapper
+
+    return decorator
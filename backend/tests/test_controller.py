@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from snapshot_manager.controller import AWSController
+from snapshot_manager.models import Volume, Volumes
+
+
+def make_volumes(*ids) -> Volumes:
+    return Volumes(
+        __root__={
+            vol_id: Volume(
+                id=vol_id,
+                state='in-use',
+                size=1,
+                volume_type='gp3',
+                create_time='2023-01-01 00:00:00',
+                tags={},
+                iops=3000,
+                snapshot_id='',
+                availability_zone='eu-west-1a',
+                attachments=[],
+                snapshots=[],
+            )
+            for vol_id in ids
+        }
+    )
+
+
+class FakeAWSController(AWSController):
+    def __init__(self, *args, **kwargs):
+        self.fetched = 0
+        self.results = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        super().__init__(*args, **kwargs)
+
+    async def _aws_describe_volumes(self) -> Volumes:
+        self.fetched += 1
+        await self.gate.wait()
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def volume_events(queue: asyncio.Queue) -> list[dict]:
+    events = []
+    while not queue.empty():
+        event = json.loads(queue.get_nowait())
+        if event['event'] == 'volumes':
+            events.append(event)
+    return events
+
+
+@pytest.fixture(autouse=True)
+def aws_region(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'eu-west-1')
+
+
+@pytest.fixture()
+def old_file_cache(tmp_path):
+    volumes_file = tmp_path / 'volumes.json'
+    volumes_file.write_text(make_volumes('vol-old').json())
+    hour_ago = time.time() - 3600
+    os.utime(volumes_file, (hour_ago, hour_ago))
+    return tmp_path
+
+
+def make_controller(cache_dir) -> tuple[FakeAWSController, asyncio.Queue]:
+    c = FakeAWSController(cache_dir=cache_dir, max_staleness=60)
+    queue = asyncio.Queue()
+    c.subscribe(queue)
+    return c, queue
+
+
+@pytest.mark.asyncio
+async def test_cold_start_from_old_file_cache_is_revalidated(old_file_cache):
+    c, queue = make_controller(old_file_cache)
+    c.results = [make_volumes('vol-new')]
+
+    volumes = await c.describe_volumes()
+
+    assert list(volumes.__root__) == ['vol-old']
+    [stale] = volume_events(queue)
+    assert stale['stale'] is True
+    assert list(stale['volumes']) == ['vol-old']
+
+    await c.refresh_tasks['volumes']
+
+    [fresh] = volume_events(queue)
+    assert fresh['stale'] is False
+    assert list(fresh['volumes']) == ['vol-new']
+    assert 'vol-new' in (old_file_cache / 'volumes.json').read_text()
+
+
+@pytest.mark.asyncio
+async def test_forced_refresh_while_running_makes_one_extra_pass(tmp_path):
+    c, queue = make_controller(tmp_path)
+    c.results = [make_volumes('vol-1'), make_volumes('vol-2'), make_volumes('vol-3')]
+    await c.describe_volumes()
+    volume_events(queue)
+
+    c.gate.clear()
+    await c.describe_volumes(force=True)
+    await asyncio.sleep(0)
+    await c.describe_volumes(force=True)
+    await c.describe_volumes(force=True)
+    assert [e['stale'] for e in volume_events(queue)] == [True, True, True]
+
+    c.gate.set()
+    await c.refresh_tasks['volumes']
+
+    assert c.fetched == 3
+    [fresh] = volume_events(queue)
+    assert fresh['stale'] is False
+    assert list(fresh['volumes']) == ['vol-3']
+
+
+@pytest.mark.asyncio
+async def test_failed_revalidation_keeps_serving_stale_data(old_file_cache):
+    c, queue = make_controller(old_file_cache)
+    c.results = [RuntimeError('AWS is down'), RuntimeError('AWS is down')]
+
+    await c.describe_volumes()
+    with pytest.raises(RuntimeError):
+        await c.refresh_tasks['volumes']
+
+    volumes = await c.describe_volumes()
+    assert list(volumes.__root__) == ['vol-old']
+    assert [e['stale'] for e in volume_events(queue)] == [True, True]
+    # last good inventory survives for the next start
+    assert 'vol-old' in (old_file_cache / 'volumes.json').read_text()
+
+    await asyncio.gather(c.refresh_tasks['volumes'], return_exceptions=True)
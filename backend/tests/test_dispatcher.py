@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from snapshot_manager.dispatcher import CommandDispatcher
+
+
+async def slow(msg, out_queue):
+    await asyncio.sleep(10)
+
+
+async def fast(msg, out_queue):
+    out_queue.put_nowait(msg['request_id'])
+
+
+def drain(queue: asyncio.Queue) -> list:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+@pytest.mark.asyncio
+async def test_slow_command_does_not_block_others():
+    out_queue = asyncio.Queue()
+    dispatcher = CommandDispatcher({'slow': slow, 'fast': fast}, out_queue)
+
+    dispatcher.dispatch({'event': 'slow', 'request_id': 'a'})
+    dispatcher.dispatch({'event': 'fast', 'request_id': 'b'})
+    await asyncio.sleep(0.01)
+
+    items = drain(out_queue)
+    assert items[0] == 'b'
+    assert (items[1].request_id, items[1].status) == ('b', 'ok')
+
+    await dispatcher.cancel_all()
+    [result] = drain(out_queue)
+    assert (result.request_id, result.status) == ('a', 'cancelled')
+
+
+@pytest.mark.asyncio
+async def test_unknown_and_duplicate_commands_get_error_result():
+    out_queue = asyncio.Queue()
+    dispatcher = CommandDispatcher({'slow': slow}, out_queue)
+
+    dispatcher.dispatch({'event': 'nope', 'request_id': 'x'})
+    dispatcher.dispatch({'event': 'slow', 'request_id': 'a'})
+    dispatcher.dispatch({'event': 'slow', 'request_id': 'a'})
+
+    unknown, duplicate = drain(out_queue)
+    assert (unknown.request_id, unknown.command, unknown.status) == ('x', 'nope', 'error')
+    assert (duplicate.request_id, duplicate.status) == ('a', 'error')
+    assert 'a' in dispatcher.tasks
+
+    await dispatcher.cancel_all()
+
+
+@pytest.mark.asyncio
+async def test_mutations_of_same_object_run_in_order():
+    policy = {'snap-1': 'Delete', 'snap-2': 'Delete'}
+    running = []
+
+    async def toggle(msg, out_queue):
+        snap_id = msg['snap_id']
+        current = policy[snap_id]
+        running.append(snap_id)
+        await asyncio.sleep(0.01)
+        policy[snap_id] = 'Retain' if current == 'Delete' else 'Delete'
+
+    out_queue = asyncio.Queue()
+    dispatcher = CommandDispatcher({'toggle': toggle}, out_queue, exclusive={'toggle': 'snap_id'})
+    for snap_id in ['snap-1', 'snap-1', 'snap-2']:
+        dispatcher.dispatch({'event': 'toggle', 'snap_id': snap_id})
+
+    await asyncio.sleep(0.005)
+    # other objects are not blocked
+    assert running == ['snap-1', 'snap-2']
+
+    await asyncio.gather(*dispatcher.tasks.values())
+    assert policy == {'snap-1': 'Delete', 'snap-2': 'Retain'}
+
+
+@pytest.mark.asyncio
+async def test_cancel_by_numeric_and_unknown_request_id():
+    out_queue = asyncio.Queue()
+    dispatcher = CommandDispatcher({'slow': slow}, out_queue)
+
+    dispatcher.dispatch({'event': 'slow', 'request_id': 7})
+    await asyncio.sleep(0)
+    dispatcher.dispatch({'event': 'cancel', 'request_id': 7})
+    dispatcher.dispatch({'event': 'cancel', 'request_id': 8})
+    await asyncio.sleep(0.01)
+
+    unknown, cancelled = drain(out_queue)
+    assert (unknown.request_id, unknown.command, unknown.status) == ('8', 'cancel', 'error')
+    assert (cancelled.request_id, cancelled.status) == ('7', 'cancelled')
+    assert not dispatcher.tasks
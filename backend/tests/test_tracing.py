@@ -0,0 +1,97 @@
+import json
+
+import httpx
+import pytest
+
+from snapshot_manager import tracing
+from snapshot_manager.tracing import span, traced_pages
+
+
+class Pages:
+    def __init__(self, *pages):
+        self.pages = pages
+
+    async def __aiter__(self):
+        for page in self.pages:
+            yield page
+
+
+@pytest.fixture()
+def export_file(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracing.configure(slow_threshold=0, export_file=path)
+    yield path
+    tracing.configure(slow_threshold=5.0)
+
+
+def exported_spans(path) -> list[dict]:
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)['resourceSpans']:
+            for scope in resource['scopeSpans']:
+                spans.extend(scope['spans'])
+    return spans
+
+
+@pytest.mark.asyncio
+async def test_traces_are_batched_and_flushed_on_shutdown(export_file):
+    for _ in range(3):
+        with span('refresh'):
+            async for _page in traced_pages('page', Pages([1, 2], [3])):
+                pass
+
+    assert not export_file.exists()
+    await tracing.shutdown()
+
+    lines = export_file.read_text().splitlines()
+    assert len(lines) == 1
+    names = [s['name'] for s in exported_spans(export_file)]
+    # exhausted paginator doesn't leave an empty span
+    assert names == ['refresh', 'page', 'page'] * 3
+
+
+def test_slow_trace_is_logged_as_tree(caplog):
+    tracing.configure(slow_threshold=0.000001)
+    try:
+        with span('refresh', kind='volumes'), span('join'):
+            pass
+    finally:
+        tracing.configure(slow_threshold=5.0)
+    [record] = [r for r in caplog.records if r.name == 'snapshot_manager.tracing']
+    assert 'refresh' in record.getMessage()
+    assert '\n  join' in record.getMessage()
+
+
+@pytest.mark.asyncio
+async def test_export_errors_are_logged_and_export_keeps_running(tmp_path, caplog):
+    path = tmp_path / 'missing' / 'traces.jsonl'
+    tracing.configure(slow_threshold=0, export_file=path)
+    exporter = tracing.TRACER.exporter
+    try:
+        with span('refresh'):
+            pass
+        await exporter.flush()
+        assert 'Cannot export traces' in caplog.text
+
+        path.parent.mkdir()
+        with span('refresh'):
+            pass
+        await tracing.shutdown()
+    finally:
+        tracing.configure(slow_threshold=5.0)
+
+    assert [s['name'] for s in exported_spans(path)] == ['refresh']
+
+
+@pytest.mark.asyncio
+async def test_collector_rejection_is_logged(caplog):
+    def reject(request):
+        return httpx.Response(400, text='bad payload')
+
+    exporter = tracing.BatchExporter(otlp_endpoint='http://collector:4318')
+    exporter.client = httpx.AsyncClient(transport=httpx.MockTransport(reject))
+    exporter.export([{'name': 'refresh'}])
+    await exporter.shutdown()
+
+    assert 'Collector rejected traces' in caplog.text
+    assert '400 bad payload' in caplog.text
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from snapshot_manager.ttl_cache import ttl_lru_cache
+
+
+@pytest.mark.asyncio
+async def test_reset_during_call_drops_stale_value():
+    state = {'value': 'old'}
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    @ttl_lru_cache(ttl=30)
+    async def load():
+        value = state['value']
+        started.set()
+        await release.wait()
+        return value
+
+    first = asyncio.create_task(load())
+    await started.wait()
+    state['value'] = 'new'
+    load.reset_cache()
+    release.set()
+    assert await first == 'old'
+
+    assert await load() == 'new'
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    release = asyncio.Event()
+    calls = []
+
+    @ttl_lru_cache(ttl=30)
+    async def load():
+        calls.append(1)
+        await release.wait()
+        return 'value'
+
+    leader = asyncio.create_task(load())
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(load())
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await follower == 'value'
+    assert not follower.cancelled()
+    assert leader.cancelled()
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_not_found_is_not_cached():
+    state = {}
+
+    @ttl_lru_cache(ttl=30)
+    async def load(key):
+        return state.get(key)
+
+    assert await load('snap-1') is None
+    state['snap-1'] = 'created'
+    assert await load('snap-1') == 'created'
@@ -0,0 +1,6 @@
+import type { PageLoad } from './$types'
+
+export const load = (({ params }) => {
+  const { slug, pv } = params
+  return { slug, pv }
+}) satisfies PageLoad
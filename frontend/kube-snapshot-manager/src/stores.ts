@@ -2,7 +2,7 @@ import { writable } from 'svelte/store'
 
 import ReconnectingWebSocket from 'reconnecting-websocket'
 import { betterName } from './lib/volumes.ts'
-import type { PV } from './types.ts'
+import type { PV, PVDetails } from './types.ts'
 import type { Writable } from 'svelte/store'
 
 export const events = writable([])
@@ -15,6 +15,13 @@ export const allSnapshots = writable<Record<string, any>>({})
 export const kubeClusters = writable(['kube1', 'kube2'])
 export const PVs: Writable<Record<string, Array<PV>>> = writable({})
 
+// per-object details loaded on demand, keyed by snapshot id / `${cluster}/${pv name}`
+export const snapshotDetails = writable<Record<string, any>>({})
+export const pvDetails: Writable<Record<string, PVDetails>> = writable({})
+
+// `stale` / `refreshed_at` of the last pushed volumes and snapshots
+export const freshness = writable<Record<string, { stale: boolean; refreshed_at: string }>>({})
+
 export const loadLocalState = () => {
   const localVolumesFilter = localStorage.getItem('volumesFilter')
   if (localVolumesFilter) {
@@ -61,6 +68,13 @@ export const addEvent = (event) => {
   })
   console.log('Event: ', event)
 
+  if (event.event === 'volumes' || event.event === 'snapshots') {
+    freshness.update((old) => ({
+      ...old,
+      [event.event]: { stale: event.stale, refreshed_at: event.refreshed_at }
+    }))
+  }
+
   switch (event.event) {
     case 'volumes': {
       allVolumes.update(() => {
@@ -85,6 +99,12 @@ export const addEvent = (event) => {
       })
       break
     }
+    case 'command_result': {
+      if (event.status !== 'ok') {
+        console.log('Command failed: ', event.command, event.request_id, event.error)
+      }
+      break
+    }
     default: {
       console.log('Unknown event type: ', event.event, event)
     }
@@ -111,10 +131,40 @@ export const connectWS = () => {
   })
 }
 
+let requestCounter = 0
+
+// every command gets request_id, backend answers with correlated `command_result`
 export const sendMsg = async (msg) => {
+  if (msg.request_id === undefined) {
+    requestCounter += 1
+    msg = { ...msg, request_id: `ui-${Date.now()}-${requestCounter}` }
+  }
   if (_ws === undefined) {
     outMessages.push(msg)
     return
   }
   _ws.send(JSON.stringify(msg))
 }
+
+const getJSON = async (url: string) => {
+  const resp = await fetch(url)
+  if (!resp.ok) {
+    console.log('Request failed: ', url, resp.status)
+    return undefined
+  }
+  return await resp.json()
+}
+
+export const loadSnapshot = async (snapId: string) => {
+  const snapshot = await getJSON(`/api/snapshots/${snapId}`)
+  if (snapshot) {
+    snapshotDetails.update((old) => ({ ...old, [snapId]: snapshot }))
+  }
+}
+
+export const loadPV = async (cluster: string, name: string) => {
+  const details = await getJSON(`/api/kube/${cluster}/pvs/${name}`)
+  if (details) {
+    pvDetails.update((old) => ({ ...old, [`${cluster}/${name}`]: details }))
+  }
+}
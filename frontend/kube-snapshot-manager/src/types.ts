@@ -9,3 +9,9 @@ export interface PV {
 	storage_class: string
 	volume: string
 }
+
+export interface PVDetails {
+	cluster: string
+	pv: PV
+	snapshots: Array<any>
+}